@@ -9,11 +9,16 @@ easy to make mistakes and the naive extractor reads the *entire* image into RAM.
 This script scans the image via `mmap`, identifies candidate DTBs by model string, and patches the
 `status` property of a given node (default: /soc/mmc@50450000) in-place.
 
+With `--fs-path` the scan is skipped: `ext4_locate.py` resolves the DTB file inside the boot
+filesystem, so the patch lands in exactly the file the bootloader loads.
+
 Safety
 ------
 * No SPI writes.
 * Only patches an existing string property *in place* and only when the new string fits in the old
   allocation (e.g., "disabled" -> "okay"). If the property is missing or too small, it refuses.
+* With `--fs-path`, it refuses unless the file is one contiguous extent and the DTB header's
+  `totalsize` fits inside the file, so no write can land in neighbouring filesystem blocks.
 """
 
 from __future__ import annotations
@@ -25,6 +30,8 @@ import struct
 import sys
 from pathlib import Path
 
+from ext4_locate import contiguous_offset, locate_file
+
 
 MAGIC = 0xD00DFEED
 
@@ -72,6 +79,20 @@ def decode_str(val: bytes) -> str:
     return ",".join(parts)
 
 
+def dts_value(val: bytes) -> str:
+    """Format a property value as DTS source (` = "str"`, ` = <cells>` or ` = [bytes]`); "" if empty."""
+    if not val:
+        return ""
+    if val.endswith(b"\x00") and all(32 <= b < 127 for b in val[:-1].replace(b"\x00", b"")):
+        parts = val[:-1].split(b"\x00")
+        if all(parts):
+            return " = " + ", ".join(f'"{p.decode("ascii")}"' for p in parts)
+    if len(val) % 4 == 0:
+        cells = [int.from_bytes(val[i : i + 4], "big") for i in range(0, len(val), 4)]
+        return " = <" + " ".join(f"0x{c:x}" for c in cells) + ">"
+    return " = [" + " ".join(f"{b:02x}" for b in val) + "]"
+
+
 def dtb_get_props(dtb: bytes) -> list[tuple[str, str, bytes]]:
     """Return [(path, prop_name, value_bytes)] for all properties."""
     h = parse_header(dtb)
@@ -178,12 +199,113 @@ def dtb_find_status_value_offset(dtb: bytes, node_path: str) -> tuple[int, int]
     return None
 
 
+def locate_dtb_file(f, mm: mmap.mmap, fs_path: str, partition: int | None, node_path: str):
+    """Resolve `fs_path` via ext4 metadata and return (offset, model, current_status, file_size), or None."""
+    try:
+        info = locate_file(f, fs_path, partition)
+    except (FileNotFoundError, ValueError) as exc:
+        print(f"ERROR: {exc}", file=sys.stderr)
+        return None
+
+    print(f"Resolved {info['path']} in partition {info['partition']} (inode {info['inode']}, {info['size']} bytes)")
+    off = contiguous_offset(info["extents"], info["size"])
+    if off is None:
+        print("ERROR: DTB file is fragmented on disk; refusing to patch across extents.", file=sys.stderr)
+        return None
+
+    dtb = mm[off : off + info["size"]]
+    try:
+        props = dtb_get_props(dtb)
+    except ValueError as exc:
+        print(f"ERROR: {fs_path} is not a valid DTB: {exc}", file=sys.stderr)
+        return None
+
+    model = ""
+    cur_status = "<missing>"
+    for p, n, v in props:
+        if p == "/" and n == "model" and not model:
+            model = decode_str(v)
+        if p == node_path and n == "status" and cur_status == "<missing>":
+            cur_status = decode_str(v)
+    return off, model, cur_status, info["size"]
+
+
+def scan_candidates(mm: mmap.mmap, match_model: str, node_path: str, max_dtb: int) -> list[tuple[int, str, str]]:
+    """Scan the whole image for DTBs and return [(offset, model, current_status)] matching `match_model`."""
+    candidates: list[tuple[int, str, str]] = []
+    pos = 0
+    magic_bytes = struct.pack(">I", MAGIC)
+    img_size = mm.size()
+
+    while True:
+        off = mm.find(magic_bytes, pos)
+        if off == -1:
+            break
+        pos = off + 4
+
+        # Quick header sanity
+        if off + 40 > img_size:
+            continue
+        hdr = mm[off : off + 40]
+        try:
+            h = parse_header(hdr)
+        except Exception:
+            continue
+
+        totalsize = h["totalsize"]
+        if totalsize <= 0 or totalsize > max_dtb:
+            continue
+        if off + totalsize > img_size:
+            continue
+
+        dtb = mm[off : off + totalsize]
+        try:
+            props = dtb_get_props(dtb)
+        except Exception:
+            continue
+
+        model = ""
+        for p, n, v in props:
+            if p == "/" and n == "model":
+                model = decode_str(v)
+                break
+        if match_model and match_model not in model:
+            continue
+
+        cur_status = "<missing>"
+        for p, n, v in props:
+            if p == node_path and n == "status":
+                cur_status = decode_str(v)
+                break
+
+        candidates.append((off, model, cur_status))
+
+    return candidates
+
+
+def pick_candidate(candidates: list[tuple[int, str, str]]) -> tuple[int, str, str]:
+    """Prefer a candidate where the node exists and is not already okay."""
+    for off, model, st in candidates:
+        if st and st != "okay" and st != "<missing>":
+            return off, model, st
+    return candidates[0]
+
+
+def write_status(mm: mmap.mmap, abs_val_off: int, val_len: int, new_status: bytes) -> None:
+    """Patch in-place: write the new (NUL-terminated) string and pad the remainder with NULs."""
+    mm[abs_val_off : abs_val_off + len(new_status)] = new_status
+    if len(new_status) < val_len:
+        mm[abs_val_off + len(new_status) : abs_val_off + val_len] = b"\x00" * (val_len - len(new_status))
+
+
 def main() -> int:
     ap = argparse.ArgumentParser(description="Auto-find and patch DTB status property inside an image (mmap-based).")
     ap.add_argument("--image", required=True, help="Path to disk image (e.g., sdcard.img)")
-    ap.add_argument("--match-model", default="FML13V03", help="Substring that must appear in DTB model")
+    ap.add_argument("--match-model", default="FML13V03", help="Substring that must appear in DTB model (also checked with --fs-path)")
     ap.add_argument("--path", default="/soc/mmc@50450000", help="Node path whose status will be patched")
     ap.add_argument("--status", default="okay", help="New status string (default: okay)")
+    ap.add_argument("--fs-path", help="Resolve the DTB by path inside an ext4 partition instead of scanning")
+    ap.add_argument("--partition", type=int, help="Partition number for --fs-path (default: try all)")
     ap.add_argument("--max-dtb", type=int, default=4 * 1024 * 1024, help="Ignore DTBs larger than this (bytes)")
     ap.add_argument("--dry-run", action="store_true", help="Scan and report candidates, do not modify the image")
     ap.add_argument("--backup-dtb", help="Write the original DTB bytes here")
@@ -202,68 +324,26 @@ def main() -> int:
     with img_path.open(mode) as f:
         mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_WRITE if not args.dry_run else mmap.ACCESS_READ)
 
-        candidates: list[tuple[int, str, str]] = []  # (offset, model, current_status)
-        pos = 0
-        magic_bytes = struct.pack(">I", MAGIC)
-        img_size = mm.size()
-
-        while True:
-            off = mm.find(magic_bytes, pos)
-            if off == -1:
-                break
-            pos = off + 4
-
-            # Quick header sanity
-            if off + 40 > img_size:
-                continue
-            hdr = mm[off : off + 40]
-            try:
-                h = parse_header(hdr)
-            except Exception:
-                continue
-
-            totalsize = h["totalsize"]
-            if totalsize <= 0 or totalsize > args.max_dtb:
-                continue
-            if off + totalsize > img_size:
-                continue
-
-            dtb = mm[off : off + totalsize]
-            try:
-                props = dtb_get_props(dtb)
-            except Exception:
-                continue
-
-            model = ""
-            for p, n, v in props:
-                if p == "/" and n == "model":
-                    model = decode_str(v)
-                    break
-            if args.match_model and args.match_model not in model:
-                continue
-
-            cur_status = "<missing>"
-            for p, n, v in props:
-                if p == args.path and n == "status":
-                    cur_status = decode_str(v)
-                    break
-
-            candidates.append((off, model, cur_status))
+        if args.fs_path:
+            located = locate_dtb_file(f, mm, args.fs_path, args.partition, args.path)
+            if located is None:
+                return 1
+            *candidate, file_size = located
+            if args.match_model not in candidate[1]:
+                print(
+                    f"ERROR: {args.fs_path} model '{candidate[1]}' does not contain '{args.match_model}'.",
+                    file=sys.stderr,
+                )
+                return 1
+            candidates = [tuple(candidate)]
+        else:
+            candidates = scan_candidates(mm, args.match_model, args.path, args.max_dtb)
 
         if not candidates:
             print("No DTB candidates found that matched the model filter.")
             return 1
 
-        # Prefer a candidate where the node exists and is not already okay.
-        pick = None
-        for off, model, st in candidates:
-            if st and st != "okay" and st != "<missing>":
-                pick = (off, model, st)
-                break
-        if pick is None:
-            pick = candidates[0]
-
-        off, model, st = pick
+        off, model, st = pick_candidate(candidates)
         print(f"Selected DTB at offset 0x{off:08x}")
         print(f"model: {model}")
         print(f"{args.path} status: {st}")
@@ -275,6 +355,13 @@ def main() -> int:
                 print(f"  0x{o:08x}  status={s}  model={m}")
 
         totalsize = read_u32_be(mm[off : off + 8], 4)
+        if args.fs_path and totalsize > file_size:
+            # Only the file's own extent is known to be the DTB; never write past it.
+            print(
+                f"ERROR: DTB header totalsize {totalsize} exceeds the file size {file_size}; refusing to patch.",
+                file=sys.stderr,
+            )
+            return 1
         dtb = mm[off : off + totalsize]
 
         loc = dtb_find_status_value_offset(dtb, args.path)
@@ -298,11 +385,7 @@ def main() -> int:
             print("Dry-run: not modifying the image.")
             return 0
 
-        # Patch in-place: write new string and pad the remainder with NULs.
-        abs_val_off = off + val_off
-        mm[abs_val_off : abs_val_off + len(new_status)] = new_status
-        if len(new_status) < val_len:
-            mm[abs_val_off + len(new_status) : abs_val_off + val_len] = b"\x00" * (val_len - len(new_status))
+        write_status(mm, off + val_off, val_len, new_status)
 
         # Export patched DTB (optional)
         if args.out_dtb:
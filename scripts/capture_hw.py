@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+"""Capture hardware logs and DT snapshots into one compressed, hashed archive.
+
+Why this exists
+--------------
+`capture_hw.sh` runs `uname`, `lsblk`, `dmesg | grep`, `zcat | grep`, `cp` and `dtc` one after another,
+each as its own process. On the board that is slow, and minimal installs without `dtc` get no DTS.
+
+This agent runs the same collectors concurrently (one thread each, with a per-collector timeout),
+reads `/proc`, `/sys`, `/dev/kmsg` and `config.gz` directly, and decodes `/sys/firmware/fdt` with the
+project's FDT parser. Results are streamed into `<out>/<distro>/<timestamp>[_label].tar.gz` together
+with `SHA256SUMS` and `capture.json`; the archive's own sha256 is written next to it.
+
+Testing
+-------
+`--root` points every path at a fake root (e.g. a directory with `proc/`, `sys/`, `dev/kmsg`), so the
+agent can be exercised on any Linux host.
+"""
+
+from __future__ import annotations
+
+import argparse
+import gzip
+import hashlib
+import io
+import json
+import os
+import queue
+import re
+import stat
+import sys
+import tarfile
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from auto_patch_vendor_image import dtb_get_props, dts_value
+
+
+MMC_LOG_RE = re.compile(r"mmc|sdhci|dwc|dwmshc|emmc", re.IGNORECASE)
+MMC_CONFIG_RE = re.compile(r"CONFIG_MMC|DWCMSHC|SDHCI", re.IGNORECASE)
+
+
+class HashingWriter:
+    """File-like wrapper that hashes everything written through it."""
+
+    def __init__(self, f):
+        self.f = f
+        self.sha = hashlib.sha256()
+
+    def write(self, data) -> int:
+        self.sha.update(data)
+        return self.f.write(data)
+
+    def flush(self) -> None:
+        self.f.flush()
+
+
+def read_text(path: Path) -> str:
+    return path.read_bytes().decode("utf-8", errors="replace")
+
+
+def collect_uname(root: Path) -> bytes:
+    # Same fields as `uname -a`, taken from procfs so a fake root can supply them.
+    kernel = root / "proc/sys/kernel"
+    u = os.uname()
+    fields = []
+    for name, fallback in (
+        ("ostype", u.sysname),
+        ("hostname", u.nodename),
+        ("osrelease", u.release),
+        ("version", u.version),
+    ):
+        p = kernel / name
+        fields.append(read_text(p).strip() if p.exists() else fallback)
+    fields.append(u.machine)
+    return (" ".join(fields) + "\n").encode()
+
+
+def collect_cmdline(root: Path) -> bytes:
+    return (root / "proc/cmdline").read_bytes()
+
+
+def collect_mmc_host(root: Path) -> bytes:
+    base = root / "sys/class/mmc_host"
+    if not base.is_dir():
+        return f"{base.relative_to(root)}: not present\n".encode()
+    lines = []
+    for entry in sorted(base.iterdir()):
+        if entry.is_symlink():
+            lines.append(f"{entry.name} -> {os.readlink(entry)}")
+        else:
+            lines.append(entry.name)
+    return ("\n".join(lines) + "\n").encode()
+
+
+def _human_size(nbytes: int) -> str:
+    size = float(nbytes)
+    for unit in ("B", "K", "M", "G", "T"):
+        if size < 1024 or unit == "T":
+            return f"{size:.0f}{unit}" if unit == "B" else f"{size:.1f}{unit}"
+        size /= 1024
+    return f"{nbytes}B"
+
+
+def collect_lsblk(root: Path) -> bytes:
+    base = root / "sys/block"
+    rows = [("NAME", "SIZE", "TYPE", "MODEL")]
+    for disk in sorted(base.iterdir()) if base.is_dir() else []:
+        # Match `lsblk -e7`: skip loop devices.
+        if disk.name.startswith("loop"):
+            continue
+        size = int(read_text(disk / "size").strip() or 0) * 512 if (disk / "size").exists() else 0
+        model_path = disk / "device/model"
+        model = read_text(model_path).strip() if model_path.exists() else ""
+        rows.append((disk.name, _human_size(size), "disk", model))
+        for part in sorted(p for p in disk.iterdir() if (p / "partition").exists()):
+            psize = int(read_text(part / "size").strip() or 0) * 512
+            rows.append((f"`-{part.name}", _human_size(psize), "part", ""))
+    widths = [max(len(r[i]) for r in rows) for i in range(4)]
+    out = [" ".join(col.ljust(w) for col, w in zip(r, widths)).rstrip() for r in rows]
+    return ("\n".join(out) + "\n").encode()
+
+
+def kmsg_records(path: Path):
+    """Yield kmsg records from `path`.
+
+    The real /dev/kmsg returns exactly one record per read(). Under `--root` it is a regular file,
+    which is read line by line so records are never split at a buffer boundary.
+    """
+    fd = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+    if not stat.S_ISCHR(os.fstat(fd).st_mode):
+        with os.fdopen(fd, "rb") as f:
+            for line in f:
+                yield line.decode("utf-8", errors="replace").rstrip("\n")
+        return
+    try:
+        while True:
+            try:
+                record = os.read(fd, 8192)
+            except BlockingIOError:
+                break
+            except BrokenPipeError:
+                # Record overwritten while reading; kmsg moves us to the next one.
+                continue
+            if not record:
+                break
+            yield from record.decode("utf-8", errors="replace").splitlines()
+    finally:
+        os.close(fd)
+
+
+def collect_dmesg_mmc(root: Path) -> bytes:
+    lines = []
+    for record in kmsg_records(root / "dev/kmsg"):
+        # "<prio>,<seq>,<usec>,<flags>;<message>"; continuation lines start with a space.
+        head, sep, msg = record.partition(";")
+        if not sep or record.startswith(" "):
+            continue
+        fields = head.split(",")
+        usec = int(fields[2]) if len(fields) > 2 and fields[2].isdigit() else 0
+        if MMC_LOG_RE.search(msg):
+            lines.append(f"[{usec // 1000000:5d}.{usec % 1000000:06d}] {msg}")
+    return ("\n".join(lines) + "\n").encode() if lines else b""
+
+
+def collect_config_mmc(root: Path) -> bytes:
+    path = root / "proc/config.gz"
+    if not path.exists():
+        return b"config.gz not present\n"
+    with gzip.open(path, "rt", encoding="utf-8", errors="replace") as f:
+        lines = [line for line in f if MMC_CONFIG_RE.search(line)]
+    return "".join(lines).encode()
+
+
+def collect_live_dtb(root: Path) -> bytes:
+    return (root / "sys/firmware/fdt").read_bytes()
+
+
+def dtb_to_dts(dtb: bytes) -> str:
+    """Render a DTS-like text view of a DTB (nodes without properties or children are omitted)."""
+    tree: dict = {"props": [], "children": {}}
+    for path, name, val in dtb_get_props(dtb):
+        node = tree
+        for part in [p for p in path.split("/") if p]:
+            node = node["children"].setdefault(part, {"props": [], "children": {}})
+        node["props"].append((name, val))
+
+    out = ["/dts-v1/;", ""]
+
+    def emit(name: str, node: dict, depth: int) -> None:
+        indent = "\t" * depth
+        out.append(f"{indent}{name} {{")
+        for pname, val in node["props"]:
+            out.append(f"{indent}\t{pname}{dts_value(val)};")
+        for cname, child in node["children"].items():
+            out.append("")
+            emit(cname, child, depth + 1)
+        out.append(f"{indent}}};")
+
+    emit("/", tree, 0)
+    return "\n".join(out) + "\n"
+
+
+COLLECTORS = {
+    "uname.txt": collect_uname,
+    "cmdline.txt": collect_cmdline,
+    "mmc_host.txt": collect_mmc_host,
+    "lsblk.txt": collect_lsblk,
+    "dmesg_mmc.txt": collect_dmesg_mmc,
+    "config_mmc.txt": collect_config_mmc,
+    "live.dtb": collect_live_dtb,
+}
+
+
+def add_member(tar: tarfile.TarFile, name: str, data: bytes, mtime: int) -> None:
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mtime = mtime
+    info.mode = 0o644
+    tar.addfile(info, io.BytesIO(data))
+
+
+def run_capture(root: Path, archive: Path, prefix: str, timeout: float) -> dict:
+    """Run all collectors and stream results into `archive`; return the capture summary."""
+    started = time.monotonic()
+    mtime = int(time.time())
+    results: dict[str, dict] = {}
+    sums: list[tuple[str, str]] = []
+    done: queue.Queue = queue.Queue()
+
+    def worker(name: str, fn) -> None:
+        t0 = time.monotonic()
+        try:
+            done.put((name, fn(root), None, time.monotonic() - t0))
+        except Exception as exc:
+            done.put((name, None, f"{type(exc).__name__}: {exc}", time.monotonic() - t0))
+
+    # Daemon threads: a collector stuck in a read must not keep the process alive after its timeout.
+    for name, fn in COLLECTORS.items():
+        threading.Thread(target=worker, args=(name, fn), name=f"collect-{name}", daemon=True).start()
+    deadline = started + timeout
+
+    archive.parent.mkdir(parents=True, exist_ok=True)
+    with archive.open("wb") as raw:
+        out = HashingWriter(raw)
+        with tarfile.open(fileobj=out, mode="w|gz") as tar:
+
+            def store(name: str, data: bytes) -> None:
+                add_member(tar, f"{prefix}/{name}", data, mtime)
+                sums.append((hashlib.sha256(data).hexdigest(), name))
+
+            # Members are written as collectors finish, so fast ones are not held up by slow ones.
+            # Track collectors, not result keys: live.dts is derived and has no collector of its own.
+            pending = set(COLLECTORS)
+            while pending:
+                try:
+                    name, data, error, elapsed = done.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    for name in pending:
+                        results[name] = {"ok": False, "error": f"timed out after {timeout}s"}
+                    break
+                pending.discard(name)
+                if error:
+                    results[name] = {"ok": False, "error": error}
+                    continue
+                store(name, data)
+                results[name] = {"ok": True, "bytes": len(data), "seconds": round(elapsed, 3)}
+                if name == "live.dtb":
+                    try:
+                        store("live.dts", dtb_to_dts(data).encode())
+                        results["live.dts"] = {"ok": True}
+                    except (ValueError, IndexError, KeyError) as exc:
+                        results["live.dts"] = {"ok": False, "error": f"FDT parse failed: {exc}"}
+
+            summary = {
+                "timestamp": datetime.now(timezone.utc).strftime("%Y-%m-%d_%H%M%SZ"),
+                "root": str(root),
+                "seconds": round(time.monotonic() - started, 3),
+                "collectors": {k: results[k] for k in sorted(results)},
+            }
+            store("capture.json", (json.dumps(summary, indent=2) + "\n").encode())
+            add_member(
+                tar,
+                f"{prefix}/SHA256SUMS",
+                "".join(f"{sha}  {name}\n" for sha, name in sorted(sums, key=lambda s: s[1])).encode(),
+                mtime,
+            )
+    summary["archive_sha256"] = out.sha.hexdigest()
+
+    archive.with_name(archive.name + ".sha256").write_text(f"{summary['archive_sha256']}  {archive.name}\n")
+    return summary
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Capture hardware logs and DT snapshots into a compressed archive.")
+    ap.add_argument("--distro", required=True, help="Distro name (e.g., debian, ubuntu)")
+    ap.add_argument("--label", help="Optional label appended to the capture name")
+    ap.add_argument("--out", default="captures", help="Output root (default: captures)")
+    ap.add_argument("--root", default="/", help="Filesystem root to read /proc, /sys and /dev from (default: /)")
+    ap.add_argument("--timeout", type=float, default=10.0, help="Per-collector timeout in seconds (default: 10)")
+    args = ap.parse_args()
+
+    root = Path(args.root)
+    if os.geteuid() != 0 and str(root) == "/":
+        print("Note: run as root for complete dmesg/config capture.", file=sys.stderr)
+
+    name = datetime.now().strftime("%Y-%m-%d_%H%M%S")
+    if args.label:
+        name = f"{name}_{args.label}"
+    archive = Path(args.out) / args.distro / f"{name}.tar.gz"
+
+    summary = run_capture(root, archive, name, args.timeout)
+    for member, res in summary["collectors"].items():
+        if not res["ok"]:
+            print(f"WARNING: {member}: {res['error']}", file=sys.stderr)
+    print(f"Capture saved to {archive} (sha256 {summary['archive_sha256']}, {summary['seconds']}s)")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""Fingerprint DTBs structurally and match a live DTB against known image candidates.
+
+Why this exists
+--------------
+To prove which DTB the board booted, `live.dtb` (from `/sys/firmware/fdt`) has to be compared with the
+candidates extracted from the image (e.g. `dtb_0817d000.dtb` vs `dtb_2b0280000.dtb`). U-Boot and
+OpenSBI rewrite `/chosen`, `/memory@*` and `/reserved-memory` before Linux sees the tree, so a plain
+sha256 never matches and every check turns into a manual `dtc` diff.
+
+The fingerprint is a sha256 over the sorted (node path, property, value) triples, with those
+bootloader-mutated nodes left out. Block layout, string-table order and header fields do not affect
+it. `extract_dtbs_from_image.py` records it per candidate (`fingerprint=` in `*.meta.txt`) and in
+`fingerprint_index.json`, so a live DTB is matched with one dict lookup; on a miss the closest
+candidate is diffed property by property.
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import struct
+import sys
+import tarfile
+from pathlib import Path
+
+from auto_patch_vendor_image import dtb_get_props, dts_value
+
+
+INDEX_NAME = "fingerprint_index.json"
+
+# Nodes rewritten by U-Boot/OpenSBI at boot. Matched by node name without the unit address, so
+# "/memory" also covers "/memory@80000000"; children are excluded with their parent.
+MUTATED_NODES = ("/chosen", "/memory", "/reserved-memory")
+# Individual properties U-Boot fills in on otherwise stable nodes.
+MUTATED_PROPS = {("/", "serial-number")}
+
+
+def is_mutated(path: str, name: str, exclude_nodes=MUTATED_NODES) -> bool:
+    if (path, name) in MUTATED_PROPS:
+        return True
+    parts = [p for p in path.split("/") if p]
+    for i in range(1, len(parts) + 1):
+        prefix = "/" + "/".join(parts[: i - 1] + [parts[i - 1].split("@", 1)[0]])
+        if prefix in exclude_nodes:
+            return True
+    return False
+
+
+def stable_props(dtb: bytes, exclude_nodes=MUTATED_NODES) -> dict[tuple[str, str], bytes]:
+    """Return {(path, prop): value} with bootloader-mutated nodes removed."""
+    return {(p, n): v for p, n, v in dtb_get_props(dtb) if not is_mutated(p, n, exclude_nodes)}
+
+
+def dtb_fingerprint(dtb: bytes, exclude_nodes=MUTATED_NODES) -> str:
+    h = hashlib.sha256()
+    for (path, name), val in sorted(stable_props(dtb, exclude_nodes).items()):
+        h.update(path.encode() + b"\x00" + name.encode() + b"\x00" + struct.pack(">I", len(val)) + val)
+    return h.hexdigest()
+
+
+def diff_props(a: dict[tuple[str, str], bytes], b: dict[tuple[str, str], bytes]) -> list[str]:
+    """Return `dtc`-diff-like lines: '-' only in a, '+' only in b, '~' changed."""
+    lines = []
+    for key in sorted(set(a) | set(b)):
+        path, name = key
+        if key not in b:
+            lines.append(f"- {path} {name}{dts_value(a[key])}")
+        elif key not in a:
+            lines.append(f"+ {path} {name}{dts_value(b[key])}")
+        elif a[key] != b[key]:
+            lines.append(f"~ {path} {name}{dts_value(a[key])}  ->{dts_value(b[key])[2:]}")
+    return lines
+
+
+def read_dtb(path: Path) -> bytes:
+    """Read a DTB file, or the `live.dtb` member of a `capture_hw.py` archive."""
+    if tarfile.is_tarfile(path):
+        with tarfile.open(path) as tar:
+            for member in tar.getmembers():
+                if member.name.endswith("/live.dtb") or member.name == "live.dtb":
+                    return tar.extractfile(member).read()
+        raise ValueError(f"{path}: no live.dtb in archive")
+    return path.read_bytes()
+
+
+def parse_meta(path: Path) -> dict[str, str]:
+    meta = {}
+    for line in path.read_text(encoding="ascii", errors="ignore").splitlines():
+        key, sep, val = line.partition("=")
+        if sep:
+            meta[key.strip()] = val.strip()
+    return meta
+
+
+def index_from_meta(out_dir: Path) -> dict[str, list[dict]]:
+    """Build {fingerprint: [{dtb, offset, sha256}]} from every `*.meta.txt` with a fingerprint in `out_dir`."""
+    index: dict[str, list[dict]] = {}
+    for meta_path in sorted(out_dir.glob("*.meta.txt")):
+        meta = parse_meta(meta_path)
+        if "fingerprint" not in meta:
+            continue
+        dtb = meta_path.name[: -len(".meta.txt")] + ".dtb"
+        index.setdefault(meta["fingerprint"], []).append(
+            {"dtb": dtb, "offset": meta.get("offset"), "sha256": meta.get("sha256")}
+        )
+    return index
+
+
+def load_index(path: Path) -> dict[str, list[dict]]:
+    """Load {fingerprint: [candidate]} from an index JSON, or from a directory's index / *.meta.txt.
+
+    Candidate `dtb` paths are made absolute so indexes from several directories can be merged.
+    """
+    if path.is_dir():
+        if not (path / INDEX_NAME).exists():
+            return {
+                fp: [{**c, "dtb": str((path / c["dtb"]).resolve())} for c in cands]
+                for fp, cands in index_from_meta(path).items()
+            }
+        path = path / INDEX_NAME
+    data = json.loads(path.read_text())
+    if tuple(data.get("exclude_nodes", MUTATED_NODES)) != MUTATED_NODES:
+        print(f"WARNING: {path} was built with different excluded nodes; rebuild it.", file=sys.stderr)
+    return {
+        fp: [{**c, "dtb": str((path.parent / c["dtb"]).resolve())} for c in cands]
+        for fp, cands in data["fingerprints"].items()
+    }
+
+
+def write_index(out_dir: Path) -> Path:
+    """Rebuild `fingerprint_index.json` in `out_dir` from all of its `*.meta.txt`.
+
+    Rebuilding rather than writing only the current run's candidates keeps DTBs from earlier
+    extractions into the same directory matchable.
+    """
+    path = out_dir / INDEX_NAME
+    doc = {"version": 1, "exclude_nodes": list(MUTATED_NODES), "fingerprints": index_from_meta(out_dir)}
+    tmp = path.with_name(INDEX_NAME + ".tmp")
+    tmp.write_text(json.dumps(doc, indent=2, sort_keys=True) + "\n")
+    tmp.replace(path)
+    return path
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Structural DTB fingerprint and live-vs-candidate matching.")
+    ap.add_argument("dtb", help="DTB to fingerprint (e.g. live.dtb, or a capture_hw.py .tar.gz)")
+    ap.add_argument(
+        "--index",
+        action="append",
+        default=[],
+        help="fingerprint_index.json or extraction dir (repeatable); match the DTB against it",
+    )
+    ap.add_argument("--max-diff", type=int, default=50, help="Max diff lines to print on mismatch (default: 50)")
+    args = ap.parse_args()
+
+    dtb_path = Path(args.dtb)
+    if not dtb_path.exists():
+        print(f"Missing: {dtb_path}", file=sys.stderr)
+        return 2
+    try:
+        dtb = read_dtb(dtb_path)
+        fp = dtb_fingerprint(dtb)
+    except (ValueError, struct.error) as exc:
+        print(f"ERROR: {dtb_path}: {exc}", file=sys.stderr)
+        return 2
+    print(f"fingerprint: {fp}")
+    if not args.index:
+        return 0
+
+    index: dict[str, list[dict]] = {}
+    for idx_path in args.index:
+        for key, cands in load_index(Path(idx_path)).items():
+            index.setdefault(key, []).extend(cands)
+
+    matches = index.get(fp, [])
+    if matches:
+        for c in matches:
+            print(f"MATCH: {c['dtb']} offset={c.get('offset')} sha256={c.get('sha256')}")
+        return 0
+
+    print("NO MATCH among", sum(len(c) for c in index.values()), "candidate(s)")
+    live = stable_props(dtb)
+    best = None
+    for cands in index.values():
+        for c in cands:
+            try:
+                props = stable_props(Path(c["dtb"]).read_bytes())
+            except (OSError, ValueError) as exc:
+                print(f"  skip {c['dtb']}: {exc}", file=sys.stderr)
+                continue
+            lines = diff_props(props, live)
+            if best is None or len(lines) < len(best[1]):
+                best = (c, lines)
+    if best is not None:
+        c, lines = best
+        print(f"Closest: {c['dtb']} offset={c.get('offset')} ({len(lines)} property difference(s))")
+        print("  ('-' only in candidate, '+' only in live, '~' changed candidate -> live)")
+        for line in lines[: args.max_diff]:
+            print(f"  {line}")
+        if len(lines) > args.max_diff:
+            print(f"  ... {len(lines) - args.max_diff} more")
+    return 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,420 @@
+#!/usr/bin/env python3
+"""Locate a file inside an ext4 partition of a raw disk image (read-only).
+
+Why this exists
+--------------
+`auto_patch_vendor_image.py` finds the DTB by scanning the whole image for the FDT magic. That works,
+but it reads every byte of a multi-GB image and can pick a stale copy that the bootloader never loads.
+Loop-mounting the image is exact, but needs root, which CI does not have.
+
+This script walks the on-disk structures directly (partition table, superblock, group descriptors,
+inodes, extent trees, directories) and resolves a path such as
+`/boot/dtbs/<ver>/eswin/eic7702-deepcomputing-fml13v03.dtb` to absolute byte extents in the image.
+Only a few KB of metadata are read.
+
+Safety
+------
+* The image is opened read-only; nothing is written.
+* Inline-data files and encrypted directories are refused rather than guessed at.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import struct
+import sys
+import uuid
+from pathlib import Path
+
+
+SECTOR_SIZE = 512
+
+EXT4_SUPER_MAGIC = 0xEF53
+EXT4_EXTENT_MAGIC = 0xF30A
+EXT4_ROOT_INO = 2
+
+INCOMPAT_64BIT = 0x80
+INCOMPAT_INLINE_DATA = 0x8000
+
+EXT4_EXTENTS_FL = 0x80000
+EXT4_INLINE_DATA_FL = 0x10000000
+EXT4_ENCRYPT_FL = 0x800
+
+S_IFMT = 0xF000
+S_IFDIR = 0x4000
+S_IFREG = 0x8000
+S_IFLNK = 0xA000
+
+MAX_SYMLINKS = 8
+
+
+def read_at(f, off: int, size: int) -> bytes:
+    f.seek(off)
+    data = f.read(size)
+    if len(data) != size:
+        raise ValueError(f"short read at 0x{off:x} ({len(data)}/{size} bytes)")
+    return data
+
+
+def list_partitions(f) -> list[dict]:
+    """Return [{index, offset, size, name, partuuid}] from a GPT or MBR partition table.
+
+    A bare filesystem image (no partition table) is returned as a single partition 0 at offset 0.
+    """
+    mbr = read_at(f, 0, SECTOR_SIZE)
+    if mbr[510:512] != b"\x55\xaa":
+        return [{"index": 0, "offset": 0, "size": None, "name": "", "partuuid": ""}]
+
+    mbr_entries = []
+    for i in range(4):
+        entry = mbr[446 + 16 * i : 446 + 16 * (i + 1)]
+        ptype = entry[4]
+        lba_start, num_sectors = struct.unpack_from("<II", entry, 8)
+        if ptype == 0 or num_sectors == 0:
+            continue
+        mbr_entries.append((i + 1, ptype, lba_start, num_sectors))
+
+    if any(ptype == 0xEE for _, ptype, _, _ in mbr_entries):
+        gpt = read_at(f, SECTOR_SIZE, 92)
+        if gpt[0:8] != b"EFI PART":
+            raise ValueError("protective MBR present but GPT header is missing")
+        entries_lba = struct.unpack_from("<Q", gpt, 72)[0]
+        num_entries, entry_size = struct.unpack_from("<II", gpt, 80)
+        table = read_at(f, entries_lba * SECTOR_SIZE, num_entries * entry_size)
+        parts = []
+        for i in range(num_entries):
+            entry = table[i * entry_size : (i + 1) * entry_size]
+            if entry[0:16] == b"\x00" * 16:
+                continue
+            first_lba, last_lba = struct.unpack_from("<QQ", entry, 32)
+            name = entry[56:128].decode("utf-16-le", errors="ignore").rstrip("\x00")
+            parts.append(
+                {
+                    "index": i + 1,
+                    "offset": first_lba * SECTOR_SIZE,
+                    "size": (last_lba - first_lba + 1) * SECTOR_SIZE,
+                    "name": name,
+                    "partuuid": str(uuid.UUID(bytes_le=entry[16:32])),
+                }
+            )
+        return parts
+
+    # Extended/logical MBR partitions are not followed; vendor images use GPT.
+    disk_sig = struct.unpack_from("<I", mbr, 440)[0]
+    return [
+        {
+            "index": idx,
+            "offset": lba * SECTOR_SIZE,
+            "size": n * SECTOR_SIZE,
+            "name": "",
+            "partuuid": f"{disk_sig:08x}-{idx:02x}",
+        }
+        for idx, _, lba, n in mbr_entries
+    ]
+
+
+class Ext4Volume:
+    """Minimal read-only view of one ext2/3/4 filesystem starting at `base` bytes in `f`."""
+
+    def __init__(self, f, base: int = 0):
+        self.f = f
+        self.base = base
+
+        sb = read_at(f, base + 1024, 1024)
+        if struct.unpack_from("<H", sb, 0x38)[0] != EXT4_SUPER_MAGIC:
+            raise ValueError(f"no ext2/3/4 superblock at 0x{base:x}")
+
+        self.block_size = 1024 << struct.unpack_from("<I", sb, 0x18)[0]
+        self.first_data_block = struct.unpack_from("<I", sb, 0x14)[0]
+        self.inodes_per_group = struct.unpack_from("<I", sb, 0x28)[0]
+        rev_level = struct.unpack_from("<I", sb, 0x4C)[0]
+        self.inode_size = struct.unpack_from("<H", sb, 0x58)[0] if rev_level >= 1 else 128
+        self.feature_incompat = struct.unpack_from("<I", sb, 0x60)[0]
+        self.label = sb[0x78:0x88].split(b"\x00", 1)[0].decode("utf-8", errors="replace")
+
+        self.desc_size = 32
+        if self.feature_incompat & INCOMPAT_64BIT:
+            self.desc_size = struct.unpack_from("<H", sb, 0xFE)[0] or 32
+        self.gdt_offset = (self.first_data_block + 1) * self.block_size
+
+    def block_offset(self, block: int) -> int:
+        """Absolute offset (in the image) of filesystem block `block`."""
+        return self.base + block * self.block_size
+
+    def read_block(self, block: int) -> bytes:
+        return read_at(self.f, self.block_offset(block), self.block_size)
+
+    def read_inode(self, ino: int) -> bytes:
+        group, index = divmod(ino - 1, self.inodes_per_group)
+        desc = read_at(self.f, self.base + self.gdt_offset + group * self.desc_size, self.desc_size)
+        table = struct.unpack_from("<I", desc, 0x8)[0]
+        if self.desc_size >= 64:
+            table |= struct.unpack_from("<I", desc, 0x28)[0] << 32
+        return read_at(self.f, self.block_offset(table) + index * self.inode_size, self.inode_size)
+
+    @staticmethod
+    def inode_mode(inode: bytes) -> int:
+        return struct.unpack_from("<H", inode, 0x0)[0]
+
+    @staticmethod
+    def inode_size_bytes(inode: bytes) -> int:
+        lo = struct.unpack_from("<I", inode, 0x4)[0]
+        hi = struct.unpack_from("<I", inode, 0x6C)[0]
+        return (hi << 32) | lo
+
+    def _extent_runs(self, node: bytes) -> list[tuple[int, int, int]]:
+        magic, entries, _max, depth = struct.unpack_from("<HHHH", node, 0)
+        if magic != EXT4_EXTENT_MAGIC:
+            raise ValueError("bad extent header magic")
+        runs: list[tuple[int, int, int]] = []
+        for i in range(entries):
+            e = 12 + 12 * i
+            if depth == 0:
+                lblk, length, start_hi, start_lo = struct.unpack_from("<IHHI", node, e)
+                # Lengths above 32768 mark uninitialized (preallocated, reads as zero) extents.
+                if length > 32768:
+                    continue
+                runs.append((lblk, (start_hi << 32) | start_lo, length))
+            else:
+                _lblk, leaf_lo, leaf_hi = struct.unpack_from("<IIH", node, e)
+                runs.extend(self._extent_runs(self.read_block((leaf_hi << 32) | leaf_lo)))
+        return runs
+
+    def _blockmap_runs(self, inode: bytes, nblocks: int) -> list[tuple[int, int, int]]:
+        per_block = self.block_size // 4
+        ptrs = list(struct.unpack_from("<15I", inode, 0x28))
+        blocks: list[int] = ptrs[:12]
+
+        def walk(block: int, level: int) -> None:
+            if len(blocks) >= nblocks:
+                return
+            if block == 0:
+                blocks.extend([0] * min(per_block**level, nblocks - len(blocks)))
+                return
+            table = struct.unpack(f"<{per_block}I", self.read_block(block))
+            for ptr in table:
+                if len(blocks) >= nblocks:
+                    return
+                if level == 1:
+                    blocks.append(ptr)
+                else:
+                    walk(ptr, level - 1)
+
+        for level, ptr in ((1, ptrs[12]), (2, ptrs[13]), (3, ptrs[14])):
+            walk(ptr, level)
+
+        runs: list[tuple[int, int, int]] = []
+        for lblk, pblk in enumerate(blocks[:nblocks]):
+            if pblk == 0:
+                continue
+            if runs and runs[-1][0] + runs[-1][2] == lblk and runs[-1][1] + runs[-1][2] == pblk:
+                runs[-1] = (runs[-1][0], runs[-1][1], runs[-1][2] + 1)
+            else:
+                runs.append((lblk, pblk, 1))
+        return runs
+
+    def block_runs(self, inode: bytes) -> list[tuple[int, int, int]]:
+        """Return [(logical_block, physical_block, length)] sorted by logical block."""
+        flags = struct.unpack_from("<I", inode, 0x20)[0]
+        if flags & EXT4_INLINE_DATA_FL:
+            raise ValueError("inline-data inodes are not supported")
+        if flags & EXT4_EXTENTS_FL:
+            runs = self._extent_runs(inode[0x28 : 0x28 + 60])
+        else:
+            nblocks = -(-self.inode_size_bytes(inode) // self.block_size)
+            runs = self._blockmap_runs(inode, nblocks)
+        return sorted(runs)
+
+    def file_extents(self, inode: bytes) -> list[tuple[int, int, int]]:
+        """Return [(file_offset, image_offset, length)] covering the file contents.
+
+        Holes are omitted; the last extent is clipped to the file size.
+        """
+        size = self.inode_size_bytes(inode)
+        extents: list[tuple[int, int, int]] = []
+        for lblk, pblk, length in self.block_runs(inode):
+            file_off = lblk * self.block_size
+            if file_off >= size:
+                break
+            nbytes = min(length * self.block_size, size - file_off)
+            extents.append((file_off, self.block_offset(pblk), nbytes))
+        return extents
+
+    def read_file(self, inode: bytes) -> bytes:
+        size = self.inode_size_bytes(inode)
+        buf = bytearray(size)
+        for file_off, img_off, length in self.file_extents(inode):
+            buf[file_off : file_off + length] = read_at(self.f, img_off, length)
+        return bytes(buf)
+
+    def read_symlink(self, inode: bytes) -> str:
+        size = self.inode_size_bytes(inode)
+        flags = struct.unpack_from("<I", inode, 0x20)[0]
+        if size < 60 and not flags & (EXT4_EXTENTS_FL | EXT4_INLINE_DATA_FL):
+            # Fast symlink: target is stored in i_block itself.
+            return inode[0x28 : 0x28 + size].decode("utf-8", errors="surrogateescape")
+        return self.read_file(inode).decode("utf-8", errors="surrogateescape")
+
+    def lookup(self, dir_inode: bytes, name: str) -> int | None:
+        flags = struct.unpack_from("<I", dir_inode, 0x20)[0]
+        if flags & EXT4_ENCRYPT_FL:
+            raise ValueError("encrypted directories are not supported")
+        want = name.encode("utf-8", errors="surrogateescape")
+        # Hashed (htree) directories keep their index in fake entries, so a linear scan still works.
+        for _, img_off, length in self.file_extents(dir_inode):
+            data = read_at(self.f, img_off, length)
+            pos = 0
+            while pos + 8 <= len(data):
+                ino, rec_len, name_len = struct.unpack_from("<IHB", data, pos)
+                if rec_len < 8:
+                    break
+                if ino and data[pos + 8 : pos + 8 + name_len] == want:
+                    return ino
+                pos += rec_len
+        return None
+
+    def resolve(self, path: str) -> tuple[int, bytes]:
+        """Resolve an absolute path (following symlinks) to (inode_number, inode_bytes)."""
+        parts = [p for p in path.split("/") if p]
+        ino = EXT4_ROOT_INO
+        inode = self.read_inode(ino)
+        stack: list[int] = [ino]
+        hops = 0
+        while parts:
+            part = parts.pop(0)
+            if part == ".":
+                continue
+            if part == "..":
+                if len(stack) > 1:
+                    stack.pop()
+                ino = stack[-1]
+                inode = self.read_inode(ino)
+                continue
+            if self.inode_mode(inode) & S_IFMT != S_IFDIR:
+                raise FileNotFoundError(f"{path}: not a directory before '{part}'")
+            child = self.lookup(inode, part)
+            if child is None:
+                raise FileNotFoundError(f"{path}: '{part}' not found")
+            child_inode = self.read_inode(child)
+            if self.inode_mode(child_inode) & S_IFMT == S_IFLNK:
+                hops += 1
+                if hops > MAX_SYMLINKS:
+                    raise FileNotFoundError(f"{path}: too many levels of symbolic links")
+                target = self.read_symlink(child_inode)
+                if target.startswith("/"):
+                    stack = [EXT4_ROOT_INO]
+                parts = [p for p in target.split("/") if p] + parts
+                ino = stack[-1]
+                inode = self.read_inode(ino)
+                continue
+            ino, inode = child, child_inode
+            stack.append(ino)
+        return ino, inode
+
+
+def candidate_paths(path: str) -> list[str]:
+    """`/boot/...` may live at the root of a separate boot partition; try both spellings."""
+    paths = [path]
+    if path.startswith("/boot/"):
+        paths.append(path[len("/boot") :])
+    return paths
+
+
+def locate_file(f, fs_path: str, partition: int | None = None) -> dict:
+    """Find `fs_path` in the image and return its partition, inode, size and absolute extents.
+
+    With `partition=None` every partition holding an ext2/3/4 filesystem is tried in table order.
+    Raises FileNotFoundError if no partition contains the path.
+    """
+    parts = list_partitions(f)
+    if partition is not None:
+        parts = [p for p in parts if p["index"] == partition]
+        if not parts:
+            raise FileNotFoundError(f"partition {partition} not found in partition table")
+
+    for path in candidate_paths(fs_path):
+        for part in parts:
+            try:
+                vol = Ext4Volume(f, part["offset"])
+            except ValueError:
+                continue
+            try:
+                ino, inode = vol.resolve(path)
+            except FileNotFoundError:
+                continue
+            if vol.inode_mode(inode) & S_IFMT != S_IFREG:
+                continue
+            return {
+                "partition": part["index"],
+                "partition_offset": part["offset"],
+                "partition_name": part["name"],
+                "fs_label": vol.label,
+                "path": path,
+                "inode": ino,
+                "size": vol.inode_size_bytes(inode),
+                "block_size": vol.block_size,
+                "extents": vol.file_extents(inode),
+            }
+    raise FileNotFoundError(f"{fs_path} not found in any ext2/3/4 partition")
+
+
+def contiguous_offset(extents: list[tuple[int, int, int]], size: int) -> int | None:
+    """Return the image offset of the file if its bytes are one contiguous, hole-free run, else None."""
+    if not extents or extents[0][0] != 0:
+        return None
+    start = extents[0][1]
+    covered = 0
+    for file_off, img_off, length in extents:
+        if file_off != covered or img_off != start + file_off:
+            return None
+        covered += length
+    return start if covered == size else None
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Resolve a file path inside an ext4 partition of a raw image (read-only).")
+    ap.add_argument("--image", required=True, help="Path to disk image (e.g., sdcard.img)")
+    ap.add_argument("--fs-path", required=True, help="Path inside the filesystem (e.g., /boot/dtbs/<ver>/eswin/x.dtb)")
+    ap.add_argument("--partition", type=int, help="Partition number to search (default: try all)")
+    ap.add_argument("--json", action="store_true", help="Print the result as JSON")
+    ap.add_argument("--extract", help="Write the file contents here")
+    args = ap.parse_args()
+
+    img_path = Path(args.image)
+    if not img_path.exists():
+        print(f"Missing image: {img_path}", file=sys.stderr)
+        return 2
+
+    with img_path.open("rb") as f:
+        try:
+            info = locate_file(f, args.fs_path, args.partition)
+        except (FileNotFoundError, ValueError) as exc:
+            print(f"ERROR: {exc}", file=sys.stderr)
+            return 1
+
+        if args.extract:
+            data = bytearray(info["size"])
+            for file_off, img_off, length in info["extents"]:
+                data[file_off : file_off + length] = read_at(f, img_off, length)
+            Path(args.extract).write_bytes(data)
+
+    if args.json:
+        print(json.dumps(info, indent=2))
+        return 0
+
+    label = f" label={info['fs_label']}" if info["fs_label"] else ""
+    print(f"partition {info['partition']} at 0x{info['partition_offset']:x}{label}")
+    print(f"{info['path']} inode={info['inode']} size={info['size']}")
+    for file_off, img_off, length in info["extents"]:
+        print(f"  file 0x{file_off:08x} -> image 0x{img_off:08x} len={length}")
+    start = contiguous_offset(info["extents"], info["size"])
+    if start is not None:
+        print(f"contiguous: yes (use --offset 0x{start:x} with patch_dtb_status.py)")
+    else:
+        print("contiguous: no")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
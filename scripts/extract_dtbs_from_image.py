@@ -11,6 +11,8 @@ import subprocess
 import sys
 from pathlib import Path
 
+from dtb_fingerprint import dtb_fingerprint, write_index
+
 MAGIC = b"\xd0\r\xfe\xed"
 HEADER_SIZE = 40
 DEFAULT_FILTERS = ["fml13", "deepcomputing", "eic7702", "dc-roma"]
@@ -38,8 +40,11 @@ def decompress_if_needed(src: Path, tmp_dir: Path) -> Path:
         if out_path.exists() and out_path.stat().st_mtime >= src.stat().st_mtime:
             return out_path
         opener = gzip.open if suffix == ".gz" else lzma.open
-        with opener(src, "rb") as fin, out_path.open("wb") as fout:
+        # Decompress to a side file so an interrupted run never leaves a "fresh" partial image behind.
+        part_path = out_path.with_name(out_path.name + ".part")
+        with opener(src, "rb") as fin, part_path.open("wb") as fout:
             shutil.copyfileobj(fin, fout, length=8 * 1024 * 1024)
+        part_path.replace(out_path)
         return out_path
     if suffix in (".zst", ".zstd"):
         raise RuntimeError("zst image detected; please decompress first (zstd -d).")
@@ -90,6 +95,55 @@ def try_dtc(dtb_path: Path):
     return dts_path
 
 
+def extract_candidates(mm: mmap.mmap, candidates, out_dir: Path, filters, ref_hash=None):
+    """Write each unique, filter-matching candidate as dtb_<offset>.dtb + .meta.txt (+ .dts if dtc exists).
+
+    Returns [(dtb_path, dts_path, sha256, filter_hits)] and writes the fingerprint index.
+    """
+    seen = set()
+    extracted = []
+
+    for idx, totalsize, off_strings, size_strings in candidates:
+        dtb = mm[idx : idx + totalsize]
+        sha = sha256_bytes(dtb)
+        if sha in seen:
+            continue
+        seen.add(sha)
+
+        strings_block = mm[idx + off_strings : idx + off_strings + size_strings]
+        match, hits = filter_match(strings_block, filters)
+        if not match:
+            continue
+
+        name = f"dtb_{idx:08x}.dtb"
+        dtb_path = out_dir / name
+        dtb_path.write_bytes(dtb)
+
+        meta_path = out_dir / f"dtb_{idx:08x}.meta.txt"
+        meta = [
+            f"offset=0x{idx:x}",
+            f"size={totalsize}",
+            f"sha256={sha}",
+        ]
+        try:
+            fingerprint = dtb_fingerprint(dtb)
+        except (ValueError, struct.error):
+            fingerprint = None
+        if fingerprint:
+            meta.append(f"fingerprint={fingerprint}")
+        if hits:
+            meta.append(f"filter_hits={','.join(hits)}")
+        if ref_hash and sha == ref_hash:
+            meta.append("matches_reference=yes")
+        meta_path.write_text("\n".join(meta) + "\n", encoding="ascii")
+
+        dts_path = try_dtc(dtb_path)
+        extracted.append((dtb_path, dts_path, sha, hits))
+
+    write_index(out_dir)
+    return extracted
+
+
 def main():
     parser = argparse.ArgumentParser(description="Extract DTBs from a vendor disk image.")
     parser.add_argument("--image", required=True, help="Path to vendor image (.img, .gz, .xz)")
@@ -124,39 +178,7 @@ def main():
     with img.open("rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
         size = mm.size()
         candidates = scan_dtbs(mm, size)
-        seen = set()
-        extracted = []
-
-        for idx, totalsize, off_strings, size_strings in candidates:
-            dtb = mm[idx : idx + totalsize]
-            sha = sha256_bytes(dtb)
-            if sha in seen:
-                continue
-            seen.add(sha)
-
-            strings_block = mm[idx + off_strings : idx + off_strings + size_strings]
-            match, hits = filter_match(strings_block, filters)
-            if not match:
-                continue
-
-            name = f"dtb_{idx:08x}.dtb"
-            dtb_path = out_dir / name
-            dtb_path.write_bytes(dtb)
-
-            meta_path = out_dir / f"dtb_{idx:08x}.meta.txt"
-            meta = [
-                f"offset=0x{idx:x}",
-                f"size={totalsize}",
-                f"sha256={sha}",
-            ]
-            if hits:
-                meta.append(f"filter_hits={','.join(hits)}")
-            if ref_hash and sha == ref_hash:
-                meta.append("matches_reference=yes")
-            meta_path.write_text("\n".join(meta) + "\n", encoding="ascii")
-
-            dts_path = try_dtc(dtb_path)
-            extracted.append((dtb_path, dts_path, sha, hits))
+        extracted = extract_candidates(mm, candidates, out_dir, filters, ref_hash)
 
     print(f"Image: {img}")
     print(f"Extracted: {len(extracted)} DTB(s) into {out_dir}")
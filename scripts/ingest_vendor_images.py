@@ -0,0 +1,499 @@
+#!/usr/bin/env python3
+"""Watch a drop directory and ingest new vendor images end to end.
+
+Why this exists
+--------------
+Every new vendor image used to mean running `record_vendor_image.sh`, `extract_dtbs_from_image.py` and
+`auto_patch_vendor_image.py` by hand, then writing the DTB summary. This script does the same work
+for every image that lands in the drop directory.
+
+Images are detected with inotify (polling if inotify is unavailable) once their size and mtime have
+settled. Each image then moves through bounded stages, one worker thread per stage, so different
+images are processed concurrently:
+
+  hash -> scan -> extract -> patch -> summarize
+
+* hash: sha256 of the dropped file, checkpointed every chunk.
+* scan: decompress (.gz/.xz) if needed and find DTB candidates. The decompressed copy is
+  deleted once the patch stage completes.
+* extract: write `dtb_<offset>.dtb` + meta + fingerprint index, like `extract_dtbs_from_image.py`.
+* patch: copy the image to `<out>/<stem>.emmcfix.img` (resumable) and patch the node status in place.
+* summarize: write `manifest.txt` and `dtb_summary.txt` next to the extracted DTBs.
+
+Checkpoints live in `<state>/<stem>/state.json`. An interrupted job resumes at the first unfinished
+stage, and the hash stage resumes at the last finished chunk. Python cannot serialize a running
+sha256, so a resumed hash records only `sha256_chunks` (sha256 over the per-chunk digests). An
+uninterrupted hash also records the plain `sha256`, which matches `sha256sum`.
+
+Safety
+------
+* The dropped image is only read; patching happens on the copy in `--out`.
+* Images are keyed by stem, so `foo.img` and `foo.img.xz` would share checkpoints and outputs. The
+  first one ingested owns the stem; the other is skipped (and logged) while the owner exists.
+"""
+
+from __future__ import annotations
+
+import argparse
+import ctypes
+import ctypes.util
+import hashlib
+import json
+import mmap
+import os
+import queue
+import re
+import select
+import shutil
+import stat
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from auto_patch_vendor_image import (
+    decode_str,
+    dtb_find_status_value_offset,
+    dtb_get_props,
+    pick_candidate,
+    read_u32_be,
+    write_status,
+)
+from extract_dtbs_from_image import decompress_if_needed, extract_candidates, scan_dtbs
+
+
+IMAGE_SUFFIXES = (".img", ".raw", ".img.gz", ".img.xz", ".img.lzma")
+STAGES = ("hash", "scan", "extract", "patch", "summarize")
+CHUNK_SIZE = 64 * 1024 * 1024
+COPY_BLOCK = 8 * 1024 * 1024
+
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+print_lock = threading.Lock()
+
+
+def log(msg: str) -> None:
+    with print_lock:
+        print(f"[{time.strftime('%H:%M:%S')}] {msg}", flush=True)
+
+
+def image_stem(path: Path) -> str:
+    name = path.name
+    for suffix in (".gz", ".xz", ".lzma"):
+        if name.endswith(suffix):
+            name = name[: -len(suffix)]
+    return re.sub(r"\.(img|raw)$", "", name)
+
+
+def stem_owner(image: Path, state_root: Path) -> str | None:
+    """Return another, still present image that already owns `image`'s stem, if any.
+
+    `foo.img` and `foo.img.xz` share a stem and therefore a checkpoint and output paths; the
+    first one ingested keeps it.
+    """
+    state_path = state_root / image_stem(image) / "state.json"
+    if not state_path.exists():
+        return None
+    owner = json.loads(state_path.read_text()).get("image")
+    if owner and owner != str(image) and Path(owner).exists():
+        return owner
+    return None
+
+
+class Job:
+    """One image moving through the stages; `state` is persisted to `<state_dir>/state.json`."""
+
+    def __init__(self, image: Path, state_root: Path, size: int, mtime_ns: int):
+        self.image = image
+        self.stem = image_stem(image)
+        self.dir = state_root / self.stem
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.state_path = self.dir / "state.json"
+        self.state: dict = {}
+        if self.state_path.exists():
+            self.state = json.loads(self.state_path.read_text())
+        if self.state.get("size") != size or self.state.get("mtime_ns") != mtime_ns:
+            # New or changed image: start over.
+            self.state = {"image": str(image), "size": size, "mtime_ns": mtime_ns, "stages": {}}
+            self.save()
+
+    def save(self) -> None:
+        tmp = self.state_path.with_name("state.json.tmp")
+        tmp.write_text(json.dumps(self.state, indent=2) + "\n")
+        tmp.replace(self.state_path)
+
+    def next_stage(self) -> str | None:
+        for stage in STAGES:
+            if stage not in self.state["stages"]:
+                return stage
+        return None
+
+    def finish(self, stage: str, result: dict) -> None:
+        self.state["stages"][stage] = result
+        self.state.pop("error", None)
+        self.save()
+
+
+def stage_hash(job: Job, args) -> dict:
+    progress = job.state.setdefault("hash_progress", {"chunk_size": CHUNK_SIZE, "chunks": []})
+    chunks: list[str] = progress["chunks"]
+    chunk_size = progress["chunk_size"]
+    full = hashlib.sha256() if not chunks else None
+    if chunks:
+        log(f"{job.stem}: resuming hash at {len(chunks) * chunk_size} bytes")
+    with job.image.open("rb") as f:
+        f.seek(len(chunks) * chunk_size)
+        while True:
+            block = f.read(chunk_size)
+            if not block:
+                break
+            if full is not None:
+                full.update(block)
+            chunks.append(hashlib.sha256(block).hexdigest())
+            job.save()
+    tree = hashlib.sha256(bytes.fromhex("".join(chunks))).hexdigest()
+    result = {"sha256_chunks": tree, "chunk_size": chunk_size}
+    if full is not None:
+        result["sha256"] = full.hexdigest()
+    job.state.pop("hash_progress", None)
+    return result
+
+
+def stage_scan(job: Job, args) -> dict:
+    img = decompress_if_needed(job.image, job.dir / "decompressed")
+    with img.open("rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        candidates = scan_dtbs(mm, mm.size())
+    return {"image": str(img), "candidates": candidates}
+
+
+def stage_extract(job: Job, args) -> dict:
+    scan = job.state["stages"]["scan"]
+    out_dir = args.vendor_out / args.distro / job.stem / "dtbs_all"
+    out_dir.mkdir(parents=True, exist_ok=True)
+    with open(scan["image"], "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        # Unfiltered, as in docs/07 (`--no-filter`); the model filter is applied by the patch stage.
+        extracted = extract_candidates(mm, scan["candidates"], out_dir, [])
+        dtbs = []
+        for dtb_path, _dts, sha, _hits in extracted:
+            off = int(dtb_path.stem.split("_", 1)[1], 16)
+            props = dtb_get_props(dtb_path.read_bytes())
+            model = next((decode_str(v) for p, n, v in props if p == "/" and n == "model"), "")
+            status = next((decode_str(v) for p, n, v in props if p == args.path and n == "status"), "<missing>")
+            dtbs.append({"dtb": dtb_path.name, "offset": off, "sha256": sha, "model": model, "status": status})
+    return {"dir": str(out_dir), "dtbs": dtbs}
+
+
+def part_path(dst: Path) -> Path:
+    return dst.with_name(dst.name + ".part")
+
+
+def copy_resumable(src: Path, dst: Path) -> None:
+    """Copy src to dst via dst.part, continuing from a partial .part left by an interrupted run."""
+    part = part_path(dst)
+    done = part.stat().st_size if part.exists() else 0
+    with src.open("rb") as fin, part.open("ab") as fout:
+        fin.seek(done)
+        shutil.copyfileobj(fin, fout, length=COPY_BLOCK)
+    part.replace(dst)
+
+
+def stage_patch(job: Job, args) -> dict:
+    result = patch_copy(job, args)
+    # The decompressed copy was only needed as the source of the patched copy.
+    src = Path(job.state["stages"]["scan"]["image"])
+    if src != job.image:
+        src.unlink(missing_ok=True)
+    return result
+
+
+def patch_copy(job: Job, args) -> dict:
+    dtbs = job.state["stages"]["extract"]["dtbs"]
+    candidates = [(d["offset"], d["model"], d["status"]) for d in dtbs if args.match_model in d["model"]]
+    if not candidates:
+        return {"patched": False, "reason": f"no DTB with model containing '{args.match_model}'"}
+    off, model, st = pick_candidate(candidates)
+
+    src = Path(job.state["stages"]["scan"]["image"])
+    args.out.mkdir(parents=True, exist_ok=True)
+    dst = args.out / f"{job.stem}.emmcfix.img"
+    if "patch_copy" not in job.state:
+        # Anything already there belongs to an older version of this image.
+        dst.unlink(missing_ok=True)
+        part_path(dst).unlink(missing_ok=True)
+        job.state["patch_copy"] = {"done": False}
+        job.save()
+    if not job.state["patch_copy"]["done"]:
+        copy_resumable(src, dst)
+        job.state["patch_copy"]["done"] = True
+        job.save()
+
+    new_status = (args.status + "\x00").encode("ascii")
+    with dst.open("r+b") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_WRITE) as mm:
+        totalsize = read_u32_be(mm[off : off + 8], 4)
+        loc = dtb_find_status_value_offset(mm[off : off + totalsize], args.path)
+        if loc is None:
+            return {"patched": False, "reason": f"no existing '{args.path}/status' property", "offset": off}
+        val_off, val_len = loc
+        if len(new_status) > val_len:
+            return {"patched": False, "reason": f"'{args.status}' longer than {val_len} bytes", "offset": off}
+        write_status(mm, off + val_off, val_len, new_status)
+        mm.flush()
+    return {"patched": True, "image": str(dst), "offset": off, "model": model, "old_status": st}
+
+
+def stage_summarize(job: Job, args) -> dict:
+    stages = job.state["stages"]
+    out_dir = args.vendor_out / args.distro / job.stem
+    manifest = [
+        f"timestamp={datetime.now(timezone.utc).strftime('%Y-%m-%d_%H%M%SZ')}",
+        f"distro={args.distro}",
+        f"image_path={job.image}",
+        f"image_size_bytes={job.state['size']}",
+    ]
+    if "sha256" in stages["hash"]:
+        manifest.append(f"sha256={stages['hash']['sha256']}")
+    manifest.append(f"sha256_chunks={stages['hash']['sha256_chunks']} chunk_size={stages['hash']['chunk_size']}")
+    patch = stages["patch"]
+    if patch["patched"]:
+        manifest.append(f"patched_image={patch['image']}")
+        manifest.append(f"patched_dtb_offset=0x{patch['offset']:x}")
+        manifest.append(f"patched={args.path} status {patch['old_status']} -> {args.status}")
+    else:
+        manifest.append(f"patched=no ({patch['reason']})")
+    (out_dir / "manifest.txt").write_text("\n".join(manifest) + "\n")
+
+    # Same layout as vendor/*/dtb_summary.txt (dtb_inspect.py --model --mmc per DTB).
+    extract_dir = Path(stages["extract"]["dir"])
+    lines = []
+    for d in stages["extract"]["dtbs"]:
+        props = dtb_get_props((extract_dir / d["dtb"]).read_bytes())
+        compat = next((decode_str(v) for p, n, v in props if p == "/" and n == "compatible"), "")
+        lines += [f"# {d['dtb']}", f"model: {d['model']}", f"compatible: {compat}"]
+        mmc: dict[str, dict] = {}
+        for path, name, val in props:
+            if "/mmc@" in path:
+                mmc.setdefault(path, {})
+                if name in ("status", "compatible", "bus-width"):
+                    mmc[path][name] = decode_str(val)
+        for path in sorted(mmc):
+            info = mmc[path]
+            lines.append(
+                f"{path} status={info.get('status', '<missing>')} compatible={info.get('compatible', '<missing>')}"
+                f" bus-width={info.get('bus-width', '<missing>')}"
+            )
+        lines.append("")
+    (out_dir / "dtb_summary.txt").write_text("\n".join(lines))
+    return {"dir": str(out_dir)}
+
+
+STAGE_FUNCS = {
+    "hash": stage_hash,
+    "scan": stage_scan,
+    "extract": stage_extract,
+    "patch": stage_patch,
+    "summarize": stage_summarize,
+}
+
+
+class Pipeline:
+    """One worker thread per stage, joined by bounded queues."""
+
+    def __init__(self, args):
+        self.args = args
+        self.queues = {stage: queue.Queue(maxsize=args.queue_size) for stage in STAGES}
+        self.active: set[str] = set()
+        # Jobs that failed in this process are not retried until the image changes or we restart.
+        self.failed: set[tuple[str, int, int]] = set()
+        self.lock = threading.Lock()
+        for stage in STAGES:
+            threading.Thread(target=self.worker, args=(stage,), name=f"stage-{stage}", daemon=True).start()
+
+    def submit(self, job: Job) -> bool:
+        stage = job.next_stage()
+        key = (job.stem, job.state["size"], job.state["mtime_ns"])
+        with self.lock:
+            if stage is None or job.stem in self.active or key in self.failed:
+                return False
+            self.active.add(job.stem)
+        log(f"{job.stem}: queued at stage '{stage}'")
+        self.queues[stage].put(job)
+        return True
+
+    def idle(self) -> bool:
+        with self.lock:
+            return not self.active
+
+    def worker(self, stage: str) -> None:
+        while True:
+            job = self.queues[stage].get()
+            t0 = time.monotonic()
+            try:
+                result = STAGE_FUNCS[stage](job, self.args)
+            except Exception as exc:
+                job.state["error"] = {"stage": stage, "error": f"{type(exc).__name__}: {exc}"}
+                job.save()
+                log(f"{job.stem}: {stage} FAILED: {type(exc).__name__}: {exc}")
+                with self.lock:
+                    self.failed.add((job.stem, job.state["size"], job.state["mtime_ns"]))
+                self.release(job)
+                continue
+            result["seconds"] = round(time.monotonic() - t0, 3)
+            job.finish(stage, result)
+            log(f"{job.stem}: {stage} done ({result['seconds']}s)")
+            nxt = job.next_stage()
+            if nxt is None:
+                log(f"{job.stem}: complete")
+                self.release(job)
+            else:
+                self.queues[nxt].put(job)
+
+    def release(self, job: Job) -> None:
+        with self.lock:
+            self.active.discard(job.stem)
+
+
+class Watcher:
+    """Report files in `drop` whose size and mtime have been stable for `settle` seconds."""
+
+    def __init__(self, drop: Path, settle: float, poll: float):
+        self.drop = drop
+        self.settle = settle
+        self.poll = poll
+        self.seen: dict[Path, tuple[int, int, float]] = {}
+        self.fd = self._inotify(drop)
+
+    @staticmethod
+    def _inotify(drop: Path) -> int | None:
+        name = ctypes.util.find_library("c")
+        try:
+            libc = ctypes.CDLL(name, use_errno=True)
+            fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if fd < 0:
+                return None
+            mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+            if libc.inotify_add_watch(fd, str(drop).encode(), mask) < 0:
+                os.close(fd)
+                return None
+            return fd
+        except (OSError, AttributeError):
+            return None
+
+    def wait(self) -> None:
+        """Sleep until the next poll, waking early on an inotify event."""
+        # Files still settling need a re-check sooner than the regular poll.
+        timeout = min(self.poll, self.settle) if self.seen else self.poll
+        if self.fd is None:
+            time.sleep(timeout)
+            return
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if ready:
+            try:
+                os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                pass
+
+    def stable_files(self) -> list[tuple[Path, int, int]]:
+        now = time.monotonic()
+        ready = []
+        current = set()
+        for path in sorted(self.drop.iterdir()):
+            if not path.name.endswith(IMAGE_SUFFIXES):
+                continue
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                # Renamed or deleted since iterdir().
+                continue
+            if not stat.S_ISREG(st.st_mode):
+                continue
+            current.add(path)
+            prev = self.seen.get(path)
+            if prev is None or prev[:2] != (st.st_size, st.st_mtime_ns):
+                self.seen[path] = (st.st_size, st.st_mtime_ns, now)
+                continue
+            if now - prev[2] >= self.settle:
+                ready.append((path, st.st_size, st.st_mtime_ns))
+        for gone in set(self.seen) - current:
+            del self.seen[gone]
+        return ready
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Watch a drop directory and ingest new vendor images.")
+    ap.add_argument("--drop", required=True, help="Directory where new vendor images appear")
+    ap.add_argument("--distro", required=True, help="Distro name for vendor/<distro>/ (e.g., debian)")
+    ap.add_argument("--out", default="out/images", help="Where patched images are written (default: out/images)")
+    ap.add_argument("--vendor-out", default="vendor", help="Root for manifests and DTBs (default: vendor)")
+    ap.add_argument("--state", help="Checkpoint directory (default: <drop>/.ingest)")
+    ap.add_argument("--path", default="/soc/mmc@50450000", help="Node path whose status will be patched")
+    ap.add_argument("--status", default="okay", help="New status string (default: okay)")
+    ap.add_argument("--match-model", default="FML13V03", help="Substring that must appear in DTB model")
+    ap.add_argument("--settle", type=float, default=5.0, help="Seconds a file must be unchanged before ingest")
+    ap.add_argument("--poll", type=float, default=10.0, help="Rescan interval in seconds (default: 10)")
+    ap.add_argument("--queue-size", type=int, default=2, help="Max jobs waiting per stage (default: 2)")
+    ap.add_argument("--once", action="store_true", help="Ingest what is in the drop directory now, then exit")
+    args = ap.parse_args()
+
+    drop = Path(args.drop).resolve()
+    if not drop.is_dir():
+        print(f"Missing drop directory: {drop}", file=sys.stderr)
+        return 2
+    args.out = Path(args.out).resolve()
+    args.vendor_out = Path(args.vendor_out).resolve()
+    state_root = Path(args.state) if args.state else drop / ".ingest"
+
+    pipeline = Pipeline(args)
+    watcher = Watcher(drop, 0.0 if args.once else args.settle, args.poll)
+    log(f"watching {drop} ({'inotify' if watcher.fd is not None else 'polling'})")
+
+    reported: dict[Path, str] = {}
+    submitted: list[Job] = []
+
+    def report(path: Path, msg: str) -> None:
+        # Skips and errors repeat on every poll; log each one once per file.
+        if reported.get(path) != msg:
+            reported[path] = msg
+            log(f"{path.name}: {msg}")
+
+    def offer(path: Path, size: int, mtime_ns: int) -> bool:
+        # Per-file problems (unreadable state.json, file vanished) are logged; the watcher keeps running.
+        try:
+            owner = stem_owner(path, state_root)
+            if owner is not None:
+                report(path, f"skipped, '{image_stem(path)}' is already used by {owner}")
+                return True
+            reported.pop(path, None)
+            job = Job(path, state_root, size, mtime_ns)
+            if pipeline.submit(job) and args.once:
+                submitted.append(job)
+        except (OSError, ValueError) as exc:
+            report(path, f"not ingested: {type(exc).__name__}: {exc}")
+            return False
+        return True
+
+    try:
+        if args.once:
+            watcher.stable_files()
+            offered = [offer(path, size, mtime_ns) for path, size, mtime_ns in watcher.stable_files()]
+            while not pipeline.idle():
+                time.sleep(0.2)
+            # Only this run's jobs count; stale checkpoints of other stems do not.
+            failed = [job.stem for job in submitted if "error" in job.state]
+            return 1 if failed or not all(offered) else 0
+
+        while True:
+            for path, size, mtime_ns in watcher.stable_files():
+                offer(path, size, mtime_ns)
+            watcher.wait()
+    except KeyboardInterrupt:
+        log("interrupted; unfinished stages resume on the next run")
+        return 130
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""Assemble a release bundle, SHA256SUMS and a deterministic compressed archive in one read.
+
+Why this exists
+--------------
+`pack_release.sh` copies each artifact into `dist/`, then re-reads every file with `sha256sum`, and never
+produces an archive. Each artifact is read up to three times, counting the manual `tar` afterwards.
+
+This packer reads each artifact once and tees the bytes into the bundle copy, the sha256 and a tar
+stream. The tar stream is piped into `zstd -T0` or `xz -T0` (whichever is available) running
+alongside, with Python's `lzma` as a single-threaded fallback.
+
+Reproducibility
+---------------
+Members are added in sorted order with fixed owner, mode and mtime (`SOURCE_DATE_EPOCH`, default 0).
+`metadata.txt` contains no wall-clock time. Identical inputs, with the same compressor version and
+`--level`, therefore give byte-identical archives. The default level is fast (3), so packing stays
+bound by the single read rather than by compression.
+
+Deduplication
+-------------
+Bundle files are hard links into a content store, `dist/.objects/<sha256>`. A per-path stat cache
+(`dist/.objects/cache.json`) predicts each artifact's hash. Every read is still teed into a temporary
+object; when the hash confirms the prediction that copy is dropped and the stored object is linked
+instead, so the store never holds bytes from a second, possibly different read.
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import io
+import json
+import lzma
+import os
+import shutil
+import subprocess
+import sys
+import tarfile
+import threading
+from datetime import datetime
+from pathlib import Path
+
+
+READ_BLOCK = 8 * 1024 * 1024
+
+# External multi-threaded compressors. The xz block size is pinned so its output does not depend on
+# the thread count; zstd output is thread-count independent already.
+COMPRESSORS = {
+    "zstd": ["zstd", "-q", "-T0", "-c", "-"],
+    "xz": ["xz", "-T0", "--block-size=16MiB", "-c", "-"],
+}
+DEFAULT_LEVEL = 3
+LEVELS = {"zstd": range(1, 20), "xz": range(0, 10), "lzma": range(0, 10)}
+SUFFIXES = {"zstd": ".tar.zst", "xz": ".tar.xz", "lzma": ".tar.xz", "none": ".tar"}
+
+
+def collect_artifacts(root: Path) -> list[tuple[str, Path]]:
+    """Return sorted [(bundle_relpath, source_path)], mirroring pack_release.sh."""
+    out_uboot = root / "out/u-boot"
+    out_linux = root / "out/linux"
+    out_opensbi = root / "out/opensbi"
+
+    items: dict[str, Path] = {}
+    for src in (out_uboot / "u-boot.bin", out_uboot / "u-boot.itb", out_uboot / "spl/u-boot-spl.bin"):
+        if src.is_file():
+            items[f"u-boot/{src.name}"] = src
+    image = out_linux / "arch/riscv/boot/Image"
+    if image.is_file():
+        items["linux/Image"] = image
+    dts = out_linux / "arch/riscv/boot/dts"
+    if dts.is_dir():
+        for src in sorted(dts.rglob("*fml13v03*.dtb")):
+            items[f"dtbs/{src.name}"] = src
+    if out_opensbi.is_dir():
+        for src in sorted(out_opensbi.rglob("fw_*.bin")):
+            items[f"opensbi/{src.name}"] = src
+    return sorted(items.items())
+
+
+def build_metadata(root: Path, epoch: int, compressor: str, level: int) -> bytes:
+    lines = [f"source_date_epoch={epoch}", f"compressor={compressor}", f"level={level}"]
+    vendor = root / "vendor"
+    if vendor.is_dir():
+        lines += ["", "[vendor-manifests]"]
+        lines += [str(p.relative_to(root)) for p in sorted(vendor.rglob("manifest.txt"))]
+    for repo in ("u-boot", "linux", "opensbi"):
+        src = root / "sources" / repo
+        if (src / ".git").is_dir():
+            rev = subprocess.run(["git", "-C", str(src), "rev-parse", "HEAD"], capture_output=True, text=True)
+            lines += ["", f"[{repo}]", rev.stdout.strip()]
+    cross = os.environ.get("CROSS_COMPILE")
+    if cross:
+        try:
+            ver = subprocess.run([f"{cross}gcc", "--version"], capture_output=True, text=True).stdout
+            lines += ["", "[toolchain]", ver.splitlines()[0] if ver else ""]
+        except OSError:
+            pass
+    return ("\n".join(lines) + "\n").encode()
+
+
+def pick_compressor(choice: str) -> str:
+    if choice != "auto":
+        return choice
+    for name in ("zstd", "xz"):
+        if shutil.which(name):
+            return name
+    return "lzma"
+
+
+class ArchiveWriter:
+    """Sink for the tar stream: an external multi-threaded compressor, or in-process lzma/none."""
+
+    def __init__(self, path: Path, compressor: str, level: int):
+        self.out = path.open("wb")
+        self.sha = hashlib.sha256()
+        self.proc = None
+        self.pump = None
+        self.lzma = None
+        if compressor in COMPRESSORS:
+            cmd = COMPRESSORS[compressor] + [f"-{level}"]
+            self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+            self.pump = threading.Thread(target=self._drain, daemon=True)
+            self.pump.start()
+        elif compressor == "lzma":
+            self.lzma = lzma.LZMACompressor(preset=level)
+
+    def _drain(self) -> None:
+        for block in iter(lambda: self.proc.stdout.read(READ_BLOCK), b""):
+            self._emit(block)
+
+    def _emit(self, data: bytes) -> None:
+        self.sha.update(data)
+        self.out.write(data)
+
+    def write(self, data) -> int:
+        if self.proc is not None:
+            self.proc.stdin.write(data)
+        elif self.lzma is not None:
+            self._emit(self.lzma.compress(data))
+        else:
+            self._emit(data)
+        return len(data)
+
+    def close(self) -> str:
+        if self.proc is not None:
+            self.proc.stdin.close()
+            self.pump.join()
+            if self.proc.wait() != 0:
+                raise RuntimeError(f"compressor exited with status {self.proc.returncode}")
+        elif self.lzma is not None:
+            self._emit(self.lzma.flush())
+        self.out.close()
+        return self.sha.hexdigest()
+
+
+class TeeReader:
+    """File-like reader that hashes what tarfile pulls through it and optionally copies it to `dest`."""
+
+    def __init__(self, src, dest=None):
+        self.src = src
+        self.dest = dest
+        self.sha = hashlib.sha256()
+
+    def read(self, n: int = -1) -> bytes:
+        data = self.src.read(n)
+        self.sha.update(data)
+        if self.dest is not None:
+            self.dest.write(data)
+        return data
+
+
+def tar_info(name: str, size: int, epoch: int, executable: bool = False) -> tarfile.TarInfo:
+    info = tarfile.TarInfo(name)
+    info.size = size
+    info.mtime = epoch
+    info.mode = 0o755 if executable else 0o644
+    info.uid = info.gid = 0
+    info.uname = info.gname = ""
+    return info
+
+
+def link_or_copy(obj: Path, dest: Path) -> None:
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        os.link(obj, dest)
+    except OSError:
+        shutil.copyfile(obj, dest)
+
+
+def store_object(store: Path, tmp: Path, sha: str) -> Path:
+    obj = store / sha
+    if obj.exists():
+        tmp.unlink()
+    else:
+        tmp.replace(obj)
+    return obj
+
+
+def pack(root: Path, dist: Path, bundle: Path, compressor: str, level: int, epoch: int) -> dict:
+    store = dist / ".objects"
+    store.mkdir(parents=True, exist_ok=True)
+    cache_path = store / "cache.json"
+    cache: dict[str, str] = json.loads(cache_path.read_text()) if cache_path.exists() else {}
+    bundle.mkdir(parents=True)
+
+    artifacts = collect_artifacts(root)
+    archive = bundle / f"release{SUFFIXES[compressor]}"
+    sink = ArchiveWriter(archive, compressor, level)
+    sums: list[tuple[str, str]] = []
+    reused = 0
+
+    with tarfile.open(fileobj=sink, mode="w|", format=tarfile.GNU_FORMAT, copybufsize=READ_BLOCK) as tar:
+        for rel, src in artifacts:
+            st = src.stat()
+            key = f"{src.resolve()}:{st.st_size}:{st.st_mtime_ns}:{st.st_ino}"
+            predicted = cache.get(key)
+            have = predicted is not None and (store / predicted).exists()
+            tmp = store / f".tmp-{os.getpid()}"
+            # Always tee into tmp: if the stat cache is wrong (file rewritten with the same size and
+            # mtime), the stored object must come from this read, the one hashed and archived.
+            with tmp.open("wb") as dest, src.open("rb") as f:
+                reader = TeeReader(f, dest)
+                tar.addfile(tar_info(rel, st.st_size, epoch, bool(st.st_mode & 0o111)), reader)
+            sha = reader.sha.hexdigest()
+            if have and sha == predicted:
+                reused += 1
+            obj = store_object(store, tmp, sha)
+            link_or_copy(obj, bundle / rel)
+            cache[key] = sha
+            sums.append((sha, rel))
+
+        meta = build_metadata(root, epoch, compressor, level)
+        (bundle / "metadata.txt").write_bytes(meta)
+        tar.addfile(tar_info("metadata.txt", len(meta), epoch), io.BytesIO(meta))
+        sums.append((hashlib.sha256(meta).hexdigest(), "metadata.txt"))
+
+        sums_text = "".join(f"{sha}  ./{rel}\n" for sha, rel in sorted(sums, key=lambda s: s[1])).encode()
+        (bundle / "SHA256SUMS").write_bytes(sums_text)
+        tar.addfile(tar_info("SHA256SUMS", len(sums_text), epoch), io.BytesIO(sums_text))
+
+    archive_sha = sink.close()
+    archive.with_name(archive.name + ".sha256").write_text(f"{archive_sha}  {archive.name}\n")
+    cache_tmp = cache_path.with_name("cache.json.tmp")
+    cache_tmp.write_text(json.dumps(cache, indent=2, sort_keys=True) + "\n")
+    cache_tmp.replace(cache_path)
+    return {"artifacts": len(artifacts), "reused": reused, "archive": archive, "archive_sha256": archive_sha}
+
+
+def main() -> int:
+    default_root = Path(__file__).resolve().parent.parent
+    ap = argparse.ArgumentParser(description="Pack release artifacts in one read: copy, SHA256SUMS, archive.")
+    ap.add_argument("--root", default=str(default_root), help="Repo root (default: parent of scripts/)")
+    ap.add_argument("--dist", help="Dist directory (default: <root>/dist)")
+    ap.add_argument("--name", help="Bundle directory name (default: current timestamp)")
+    ap.add_argument(
+        "--compress",
+        choices=("auto", "zstd", "xz", "lzma", "none"),
+        default="auto",
+        help="Archive compressor (default: auto = zstd, else xz, else in-process lzma)",
+    )
+    ap.add_argument(
+        "--level",
+        type=int,
+        default=DEFAULT_LEVEL,
+        help=f"Compression level (default: {DEFAULT_LEVEL}; part of what makes archives reproducible)",
+    )
+    args = ap.parse_args()
+
+    root = Path(args.root).resolve()
+    dist = Path(args.dist).resolve() if args.dist else root / "dist"
+    name = args.name or datetime.now().strftime("%Y-%m-%d_%H%M%S")
+    epoch = int(os.environ.get("SOURCE_DATE_EPOCH", "0"))
+    compressor = pick_compressor(args.compress)
+    if compressor in COMPRESSORS and not shutil.which(compressor):
+        print(f"{compressor} not found in PATH", file=sys.stderr)
+        return 1
+    if compressor in LEVELS and args.level not in LEVELS[compressor]:
+        levels = LEVELS[compressor]
+        print(f"--level for {compressor} must be {levels[0]}-{levels[-1]}", file=sys.stderr)
+        return 1
+
+    if (dist / name).exists():
+        print(f"Bundle already exists: {dist / name}", file=sys.stderr)
+        return 1
+
+    result = pack(root, dist, dist / name, compressor, args.level, epoch)
+    print(f"Release bundle created: {dist / name}")
+    print(f"artifacts: {result['artifacts']} ({result['reused']} unchanged, linked from the store)")
+    print(f"archive: {result['archive'].name} sha256={result['archive_sha256']}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+"""Report boot/root/label sanity checks as JSON, without spawning any processes.
+
+Why this exists
+--------------
+`verify_boot_state.sh` shells out to `findmnt`, `lsblk`, `blkid | awk | sort | uniq`, `systemctl` and
+`awk`, which is slow on the board, and prints free text that has to be scraped.
+
+This script reads `/proc/cmdline`, `/proc/self/mountinfo`, `/sys/block`, `/proc/device-tree` and the
+partition tables and superblocks of each disk directly (a few KB per disk), parses extlinux.conf in
+process, and prints one JSON document. LABELs are read for ext2/3/4, FAT and swap, the types found on
+the SD and eMMC layouts; partitions of other types count as unlabelled in `unique_labels`. `--watch` re-evaluates on an interval and prints a JSON line
+only when the result changes, so it is cheap enough to leave running on every boot.
+
+Testing
+-------
+`--root` points every path at a fake root. Block devices are opened as `<root>/dev/<name>`, so a raw
+image file there stands in for a disk.
+
+Exit status is 0 when all error-level checks pass and 1 otherwise; "note" checks are informational.
+The LABEL/PARTUUID uniqueness checks fail when a disk cannot be read (run as root for a full check).
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import time
+from pathlib import Path
+
+from ext4_locate import Ext4Volume, list_partitions, read_at
+
+
+DT_EMMC_NODE = "soc/mmc@50450000"
+SERIAL_GETTY = "serial-getty@ttyS0.service"
+# Swap header offsets of the signature for common page sizes (4K, 16K, 64K).
+SWAP_PAGE_SIZES = (4096, 16384, 65536)
+
+
+def read_text(path: Path) -> str | None:
+    try:
+        return path.read_bytes().decode("utf-8", errors="replace")
+    except OSError:
+        return None
+
+
+def parse_cmdline(text: str) -> dict[str, str]:
+    params: dict[str, str] = {}
+    for tok in text.split():
+        key, _, val = tok.partition("=")
+        params[key] = val
+    return params
+
+
+def parse_mountinfo(text: str) -> dict[str, dict]:
+    """Return {mount_point: {devno, source, fstype}} from /proc/self/mountinfo (last mount wins)."""
+    mounts: dict[str, dict] = {}
+    for line in text.splitlines():
+        pre, sep, post = line.partition(" - ")
+        if not sep:
+            continue
+        fields = pre.split()
+        tail = post.split()
+        if len(fields) < 5 or len(tail) < 2:
+            continue
+        target = fields[4].replace("\\040", " ")
+        mounts[target] = {"devno": fields[2], "fstype": tail[0], "source": tail[1]}
+    return mounts
+
+
+def block_devices(root: Path) -> dict[str, dict]:
+    """Return {name: {disk, partition, devno, type}} for all disks and partitions in /sys/block."""
+    devices: dict[str, dict] = {}
+    base = root / "sys/block"
+    if not base.is_dir():
+        return devices
+    for disk in sorted(base.iterdir()):
+        if disk.name.startswith(("loop", "ram", "zram")):
+            continue
+        dev_type = (read_text(disk / "device/type") or "").strip()
+        devices[disk.name] = {
+            "disk": disk.name,
+            "partition": None,
+            "devno": (read_text(disk / "dev") or "").strip(),
+            "type": dev_type,
+        }
+        for part in sorted(disk.iterdir()):
+            pnum = read_text(part / "partition")
+            if pnum is None:
+                continue
+            devices[part.name] = {
+                "disk": disk.name,
+                "partition": int(pnum.strip()),
+                "devno": (read_text(part / "dev") or "").strip(),
+                "type": dev_type,
+            }
+    return devices
+
+
+def fat_label(boot: bytes) -> str | None:
+    """Volume label from a FAT boot sector, or None if `boot` is not FAT."""
+    if boot[510:512] != b"\x55\xaa":
+        return None
+    if boot[0x52:0x57] == b"FAT32":
+        sig, label = boot[0x42], boot[0x47:0x52]
+    elif boot[0x36:0x39] == b"FAT":
+        sig, label = boot[0x26], boot[0x2B:0x36]
+    else:
+        return None
+    if sig != 0x29:
+        return ""
+    label = label.decode("latin-1").rstrip(" \x00")
+    return "" if label == "NO NAME" else label
+
+
+def fs_label(f, offset: int) -> str:
+    """Filesystem LABEL as blkid reports it, for ext2/3/4, FAT and swap; "" if unknown or unset."""
+    try:
+        return Ext4Volume(f, offset).label
+    except ValueError:
+        pass
+    try:
+        label = fat_label(read_at(f, offset, 512))
+        if label is not None:
+            return label
+        for page in SWAP_PAGE_SIZES:
+            if read_at(f, offset + page - 10, 10) in (b"SWAPSPACE2", b"SWAP-SPACE"):
+                return read_at(f, offset + 1052, 16).split(b"\x00", 1)[0].decode("utf-8", errors="replace")
+    except ValueError:
+        pass
+    return ""
+
+
+def read_partition_tables(root: Path, devices: dict[str, dict]) -> tuple[dict[str, dict], dict[str, str]]:
+    """Read each disk's partition table and filesystem labels (ext2/3/4, FAT, swap).
+
+    Returns ({partition_name: {partuuid, label}}, {disk: error}) for disks that could not be read.
+    """
+    info: dict[str, dict] = {}
+    errors: dict[str, str] = {}
+    by_disk_index = {(d["disk"], d["partition"]): name for name, d in devices.items() if d["partition"]}
+    for disk in sorted({d["disk"] for d in devices.values()}):
+        try:
+            with (root / "dev" / disk).open("rb") as f:
+                for part in list_partitions(f):
+                    name = by_disk_index.get((disk, part["index"]))
+                    if name is None:
+                        continue
+                    info[name] = {"partuuid": part["partuuid"], "label": fs_label(f, part["offset"])}
+        except (OSError, ValueError) as exc:
+            errors[disk] = f"{type(exc).__name__}: {exc}"
+    return info, errors
+
+
+def parse_extlinux(text: str) -> dict:
+    """Parse extlinux.conf into {default, timeout, labels: [{label, linux, initrd, fdt, fdtdir, append, ...}]}."""
+    conf: dict = {"default": None, "timeout": None, "labels": []}
+    entry: dict | None = None
+    keys = {"kernel": "linux", "linux": "linux", "initrd": "initrd", "fdt": "fdt", "devicetree": "fdt"}
+    for raw in text.splitlines():
+        line = raw.strip()
+        if not line or line.startswith("#"):
+            continue
+        # Keywords are separated by any whitespace, as in U-Boot's pxe parser.
+        parts = line.split(None, 1)
+        key = parts[0].lower()
+        val = parts[1].strip() if len(parts) > 1 else ""
+        if key == "default":
+            conf["default"] = val
+        elif key == "timeout":
+            conf["timeout"] = val
+        elif key == "label":
+            entry = {"label": val}
+            conf["labels"].append(entry)
+        elif entry is None:
+            continue
+        elif key == "menu" and val.lower().startswith("label"):
+            entry["menu_label"] = val[len("label") :].strip()
+        elif key in keys:
+            entry[keys[key]] = val
+        elif key in ("fdtdir", "devicetreedir"):
+            entry["fdtdir"] = val
+        elif key == "append":
+            entry["append"] = val
+    return conf
+
+
+def device_for_mount(mount: dict | None, devices: dict[str, dict]) -> str | None:
+    if mount is None:
+        return None
+    for name, dev in devices.items():
+        if dev["devno"] and dev["devno"] == mount["devno"]:
+            return name
+    src = mount["source"]
+    if src.startswith("/dev/") and src[len("/dev/") :] in devices:
+        return src[len("/dev/") :]
+    return None
+
+
+def media_kind(dev: dict | None) -> str | None:
+    """Map the mmc card type to the boot media names used in the docs."""
+    if dev is None:
+        return None
+    return {"MMC": "emmc", "SD": "sd"}.get(dev["type"], dev["type"].lower() or "unknown")
+
+
+def duplicates(values) -> list[str]:
+    seen: set[str] = set()
+    dup: set[str] = set()
+    for v in values:
+        if not v:
+            continue
+        if v in seen:
+            dup.add(v)
+        seen.add(v)
+    return sorted(dup)
+
+
+def collect_state(root: Path) -> dict:
+    cmdline_text = read_text(root / "proc/cmdline") or ""
+    cmdline = parse_cmdline(cmdline_text)
+    mounts = parse_mountinfo(read_text(root / "proc/self/mountinfo") or "")
+    devices = block_devices(root)
+    partinfo, table_errors = read_partition_tables(root, devices)
+
+    dt_status = read_text(root / "proc/device-tree" / DT_EMMC_NODE / "status")
+    if dt_status is not None:
+        dt_status = dt_status.rstrip("\x00")
+
+    extlinux_path = root / "boot/extlinux/extlinux.conf"
+    extlinux_text = read_text(extlinux_path)
+    extlinux = parse_extlinux(extlinux_text) if extlinux_text is not None else None
+
+    getty_link = root / "etc/systemd/system/getty.target.wants" / SERIAL_GETTY
+    getty = "enabled" if getty_link.exists() or getty_link.is_symlink() else "disabled"
+
+    mounted = {}
+    for target in ("/", "/boot"):
+        m = mounts.get(target)
+        name = device_for_mount(m, devices)
+        dev = devices.get(name) if name else None
+        mounted[target] = {
+            "source": m["source"] if m else None,
+            "fstype": m["fstype"] if m else None,
+            "device": name,
+            "disk": dev["disk"] if dev else None,
+            "media": media_kind(dev),
+            **partinfo.get(name, {}),
+        }
+
+    root_arg = cmdline.get("root", "")
+    root_partuuid = root_arg[len("PARTUUID=") :].lower() if root_arg.upper().startswith("PARTUUID=") else None
+    partuuid_matches = sorted(n for n, p in partinfo.items() if root_partuuid and p["partuuid"] == root_partuuid)
+
+    checks = []
+
+    def check(name: str, ok: bool, detail: str, level: str = "error") -> None:
+        checks.append({"name": name, "ok": ok, "level": level, "detail": detail})
+
+    def check_unique(name: str, kind: str, key: str) -> None:
+        dup = duplicates(p[key] for p in partinfo.values())
+        notes = [f"duplicate {kind}: " + ", ".join(dup)] if dup else []
+        # An unreadable disk (e.g. unprivileged run) may hold the duplicate, so uniqueness is unproven.
+        if table_errors:
+            notes.append("cannot verify, unreadable disks: " + ", ".join(sorted(table_errors)))
+        check(name, not notes, "; ".join(notes))
+
+    check("emmc_dt_status", dt_status == "okay", f"{DT_EMMC_NODE}/status={dt_status}")
+    check_unique("unique_labels", "LABELs", "label")
+    check_unique("unique_partuuids", "PARTUUIDs", "partuuid")
+    if root_partuuid:
+        check(
+            "root_partuuid_mounted",
+            partuuid_matches == [mounted["/"]["device"]],
+            f"root=PARTUUID={root_partuuid} matches {partuuid_matches or 'nothing'}, / is {mounted['/']['device']}",
+        )
+    check("extlinux_present", extlinux is not None, str(extlinux_path.relative_to(root)))
+    if extlinux is not None:
+        names = [e["label"] for e in extlinux["labels"]]
+        check(
+            "extlinux_default_exists",
+            extlinux["default"] in names,
+            f"default={extlinux['default']} labels={names}",
+        )
+    same = mounted["/"]["device"] is not None and mounted["/"]["device"] == mounted["/boot"]["device"]
+    # Informational only, as in verify_boot_state.sh: a single SD/eMMC layout is valid.
+    check("root_boot_separate", not same, f"/ and /boot both on {mounted['/']['device']}" if same else "", "note")
+
+    return {
+        "cmdline": cmdline_text.strip(),
+        "boot_source": mounted["/boot"]["media"] or mounted["/"]["media"],
+        "root_param": root_arg or None,
+        "root_partuuid": root_partuuid,
+        "mounts": mounted,
+        "dt": {DT_EMMC_NODE: dt_status},
+        "partitions": {name: {**devices[name], **partinfo[name]} for name in sorted(partinfo)},
+        "unreadable_disks": table_errors,
+        "extlinux": extlinux,
+        "serial_getty_ttyS0": getty,
+        "checks": checks,
+        "ok": all(c["ok"] for c in checks if c["level"] == "error"),
+    }
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Verify SD/eMMC boot state and print JSON (no subprocesses).")
+    ap.add_argument("--root", default="/", help="Filesystem root to inspect (default: /)")
+    ap.add_argument("--watch", type=float, metavar="SECONDS", help="Re-check every SECONDS; print a line on change")
+    ap.add_argument("--count", type=int, help="With --watch, stop after this many checks")
+    args = ap.parse_args()
+
+    root = Path(args.root)
+    if args.watch is None:
+        state = collect_state(root)
+        print(json.dumps(state, indent=2))
+        return 0 if state["ok"] else 1
+
+    last = None
+    n = 0
+    try:
+        while args.count is None or n < args.count:
+            state = collect_state(root)
+            line = json.dumps(state, sort_keys=True)
+            if line != last:
+                print(json.dumps({"time": time.strftime("%Y-%m-%dT%H:%M:%S%z"), **state}), flush=True)
+                last = line
+            n += 1
+            if args.count is None or n < args.count:
+                time.sleep(args.watch)
+    except KeyboardInterrupt:
+        pass
+    return 0 if last is None or json.loads(last)["ok"] else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())